@@ -1,9 +1,11 @@
 import typing as T
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 
 # TODO: imports
 from .lookup import CDL_CROP_LABELS, CDL_CROP_LABELS_r
-from .utils import LabeledData
+from .utils import LabeledData, SegmentProps
 from ..augment.augmentation import augment
 from ..errors import TopologyClipError
 from ..utils.geometry import bounds_to_frame, warp_by_image
@@ -11,13 +13,14 @@ from ..utils.geometry import bounds_to_frame, warp_by_image
 import geowombat as gw
 from geowombat.core import polygon_to_array
 import numpy as np
-from scipy.ndimage.measurements import label as nd_label, sum as nd_sum
-from scipy import stats as sci_stats
+import numba
+from numba import njit, prange
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import ndimage as ndi
+import cc3d
 import cv2
 import geopandas as gpd
 from shapely.geometry import box
-from skimage.measure import regionprops
-from skimage.morphology import thin as sk_thin
 import xarray as xr
 from tqdm.auto import tqdm
 import torch
@@ -26,6 +29,15 @@ from torch_geometric.data import Data
 
 CROP_CLASS = 1
 EDGE_CLASS = 2
+NEIGHBOR_MEAN_KERNEL = np.array(
+    [
+        [0, 0.25, 0],
+        [0.25, 0, 0.25],
+        [0, 0.25, 0]
+    ]
+)
+# Number of set bits for each uint8 value
+POPCOUNT_LUT = np.unpackbits(np.arange(256, dtype='uint8')[:, None], axis=1).sum(axis=1).astype('uint8')
 
 
 def remove_noncrop(xvars: np.ndarray, labels_array: np.ndarray) -> T.Tuple[np.ndarray, np.ndarray]:
@@ -36,88 +48,138 @@ def remove_noncrop(xvars: np.ndarray, labels_array: np.ndarray) -> T.Tuple[np.nd
     bdist = xvars[-1]
     bdist = bdist * np.uint8(labels_array > 0)
     xvars[-1] = bdist
-    # Remove non-crop edges
-    bdist = np.pad(bdist, pad_width=((5, 5), (5, 5)), mode='edge')
-    dist_mean = np.zeros_like(bdist)
-    dist_mean[1:-1, 1:-1] = dist_mean[1:-1, 1:-1] + np.roll(bdist, 1, axis=1)[1:-1, 1:-1]
-    dist_mean[1:-1, 1:-1] = dist_mean[1:-1, 1:-1] + np.roll(bdist, -1, axis=1)[1:-1, 1:-1]
-    dist_mean[1:-1, 1:-1] = dist_mean[1:-1, 1:-1] + np.roll(bdist, 1, axis=0)[1:-1, 1:-1]
-    dist_mean[1:-1, 1:-1] = dist_mean[1:-1, 1:-1] + np.roll(bdist, -1, axis=0)[1:-1, 1:-1]
-    dist_mean = (dist_mean / 4.0)[5:-5, 5:-5]
+    # Remove non-crop edges (the mean of the 4 direct neighbors)
+    dist_mean = ndi.correlate(bdist, NEIGHBOR_MEAN_KERNEL, mode='nearest')
     labels_array = labels_array * np.uint8(dist_mean > 0)
 
     return xvars, labels_array
 
 
-def roll(
-    arr_pad: np.ndarray, shift: T.Union[int, T.Tuple[int, int]], axis: T.Union[int, T.Tuple[int, int]]
-) -> np.ndarray:
-    """Rolls array elements along a given axis and slices off padded edges"""
-    return np.roll(arr_pad, shift, axis=axis)[1:-1, 1:-1]
+def label_segments(mask: np.ndarray) -> T.Tuple[np.ndarray, int]:
+    """Labels the 4-connected segments of a binary mask
+    """
+    return cc3d.connected_components(np.uint8(mask), connectivity=4, return_N=True)
+
+
+def segment_props(segments: np.ndarray) -> T.List[SegmentProps]:
+    """Gets the bounding box and area of each labeled segment
+    """
+    stats = cc3d.statistics(segments)
+    props = []
+    for lab, (bbox, area) in enumerate(zip(stats['bounding_boxes'], stats['voxel_counts'])):
+        if (lab == 0) or (area == 0):
+            continue
+        row_slice, col_slice = bbox
+        props.append(
+            SegmentProps(
+                label=lab,
+                bbox=(row_slice.start, col_slice.start, row_slice.stop, col_slice.stop),
+                area=int(area)
+            )
+        )
+
+    return props
+
+
+def _padded_views(arr: np.ndarray, r: int = 1) -> np.ndarray:
+    """Pads an array once and returns a (rows x columns x 2r+1 x 2r+1) zero-copy view of each neighborhood
+    """
+    arr_pad = np.pad(arr, pad_width=((r, r), (r, r)), mode='edge')
+
+    return sliding_window_view(arr_pad, (2*r+1, 2*r+1))
+
+
+@njit(parallel=True, cache=True, fastmath=True)
+def _focal_compare_kernel(windows: np.ndarray, out: np.ndarray) -> None:
+    """Packs the 8 neighbor matches of each non-zero central pixel into one byte
+
+    Bit b is set if the b-th neighbor (row-major order, skipping the center) equals the center.
+    """
+    nrows, ncols = out.shape
+    for i in prange(nrows):
+        for j in range(ncols):
+            center = windows[i, j, 1, 1]
+            if center > 0:
+                mask = 0
+                bit = 0
+                for k in range(3):
+                    for m in range(3):
+                        if (k == 1) and (m == 1):
+                            continue
+                        if windows[i, j, k, m] == center:
+                            mask |= 1 << bit
+                        bit += 1
+                out[i, j] = mask
 
 
 def focal_compare(arr: np.ndarray) -> np.ndarray:
     """Calculates a focal comparison of neighbors and the central pixel
+
+    Returns:
+        The number of 3x3 cells (including the center) that match each non-zero central pixel
     """
-    out = [np.where(arr.squeeze().copy() > 0, 1, 0)]
-    arr_pad = np.pad(arr, pad_width=((1, 1), (1, 1)), mode='edge')
-    # Direct neighbors
-    out.append(np.where(roll(arr_pad, 1, axis=0) == arr, 1, 0))
-    out.append(np.where(roll(arr_pad, -1, axis=0) == arr, 1, 0))
-    out.append(np.where(roll(arr_pad, 1, axis=1) == arr, 1, 0))
-    out.append(np.where(roll(arr_pad, -1, axis=1) == arr, 1, 0))
-    # Corner neighbors
-    out.append(np.where(roll(arr_pad, (1, 1), axis=(0, 1)) == arr, 1, 0))
-    out.append(np.where(roll(arr_pad, (1, -1), axis=(0, 1)) == arr, 1, 0))
-    out.append(np.where(roll(arr_pad, (-1, 1), axis=(0, 1)) == arr, 1, 0))
-    out.append(np.where(roll(arr_pad, (-1, -1), axis=(0, 1)) == arr, 1, 0))
-
-    return np.array(out).sum(axis=0) * out[0]
+    arr = arr.squeeze()
+    neighbor_mask = np.zeros(arr.shape, dtype='uint8')
+    _focal_compare_kernel(_padded_views(arr), neighbor_mask)
+    # Count the matching neighbors and add the center pixel
+    counts = POPCOUNT_LUT[neighbor_mask] + np.uint8(1)
+
+    return counts * np.uint8(arr > 0)
+
+
+def thin_edges(edges: np.ndarray) -> np.ndarray:
+    """Thins binary edges to single-pixel lines
+
+    The array is edge-padded because OpenCV does not thin the outer image border.
+    """
+    edges_pad = np.pad(edges, pad_width=((1, 1), (1, 1)), mode='edge')
+    thinned = cv2.ximgproc.thinning(
+        np.uint8(edges_pad > 0) * np.uint8(255), thinningType=cv2.ximgproc.THINNING_GUOHALL
+    )
+
+    return np.uint8(thinned[1:-1, 1:-1] > 0)
 
 
 def focal_stat(arr: np.ndarray, stat: str = 'var') -> np.ndarray:
-    """Calculates the focal variance
+    """Calculates a focal statistic over the 3x3 neighborhood
     """
-    out = [arr.squeeze().copy()]
-    arr_pad = np.pad(arr, pad_width=((1, 1), (1, 1)), mode='edge')
-    # Direct neighbors
-    out.append(roll(arr_pad, 1, axis=0))
-    out.append(roll(arr_pad, -1, axis=0))
-    out.append(roll(arr_pad, 1, axis=1))
-    out.append(roll(arr_pad, -1, axis=1))
-    # Corner neighbors
-    out.append(roll(arr_pad, (1, 1), axis=(0, 1)))
-    out.append(roll(arr_pad, (1, -1), axis=(0, 1)))
-    out.append(roll(arr_pad, (-1, 1), axis=(0, 1)))
-    out.append(roll(arr_pad, (-1, -1), axis=(0, 1)))
-
-    return getattr(np, stat)(np.array(out), axis=0)
+    windows = _padded_views(arr.squeeze())
+
+    return getattr(np, stat)(windows, axis=(-2, -1))
+
+
+@njit(parallel=True, cache=True)
+def _fill_field_gaps_kernel(arr: np.ndarray, out: np.ndarray, reset_edges: bool) -> None:
+    """Fills non-crop pixels that have crop among their 4 direct (non-edge) neighbors
+    """
+    nrows, ncols = arr.shape
+    for i in prange(nrows):
+        # Clamp neighbors at the image borders (equivalent to edge padding)
+        up = max(i - 1, 0)
+        down = min(i + 1, nrows - 1)
+        for j in range(ncols):
+            center = arr[i, j]
+            if center == EDGE_CLASS:
+                out[i, j] = EDGE_CLASS if reset_edges else 0
+            elif center == 0:
+                left = max(j - 1, 0)
+                right = min(j + 1, ncols - 1)
+                nsum = 0
+                for value in (arr[up, j], arr[down, j], arr[i, left], arr[i, right]):
+                    # Edges do not count toward the neighbor sum
+                    if value != EDGE_CLASS:
+                        nsum += value
+                out[i, j] = CROP_CLASS if nsum > 0 else 0
+            else:
+                out[i, j] = center
 
 
 def fill_field_gaps(arr: np.ndarray, reset_edges: T.Optional[bool] = False) -> np.ndarray:
     """Fills gaps between fields and edges
     """
-    arr = arr.squeeze().copy().astype('float64')
-    arr[arr == EDGE_CLASS] = np.nan
-    out = [arr]
-    arr_pad = np.pad(arr, pad_width=((1, 1), (1, 1)), mode='edge')
-    # Direct neighbors
-    out.append(roll(arr_pad, 1, axis=0))
-    out.append(roll(arr_pad, -1, axis=0))
-    out.append(roll(arr_pad, 1, axis=1))
-    out.append(roll(arr_pad, -1, axis=1))
-    # Corner neighbors
-    # out.append(np.roll(arr_pad, (1, 1), axis=(0, 1))[1:-1, 1:-1])
-    # out.append(np.roll(arr_pad, (1, -1), axis=(0, 1))[1:-1, 1:-1])
-    # out.append(np.roll(arr_pad, (-1, 1), axis=(0, 1))[1:-1, 1:-1])
-    # out.append(np.roll(arr_pad, (-1, -1), axis=(0, 1))[1:-1, 1:-1])
-
-    nsum = np.nansum(np.array(out), axis=0)
-    if reset_edges:
-        arr[np.isnan(arr)] = EDGE_CLASS
-    out = np.where((arr == 0) & (nsum > 0), CROP_CLASS, arr.astype('int64'))
-    if not reset_edges:
-        out[np.isnan(out)] = 0
+    arr = np.ascontiguousarray(arr.squeeze())
+    out = np.empty(arr.shape, dtype='uint8')
+    _fill_field_gaps_kernel(arr, out, reset_edges)
 
     return out
 
@@ -127,11 +189,13 @@ def check_slivers(
 ) -> T.Tuple[np.ndarray, list]:
     """Checks for small segment slivers
     """
-    props = regionprops(segments)
+    props = segment_props(segments)
+    # Flag thin segments by label, then remove them in a single pass
+    is_sliver = np.zeros(segments.max()+1, dtype=bool)
     for p in props:
         min_row, min_col, max_row, max_col = p.bbox
-        if (max_row - min_row <= 1) or (max_col - min_col <= 1):
-            labels_array[segments == p.label] = 0
+        is_sliver[p.label] = (max_row - min_row <= 1) or (max_col - min_col <= 1)
+    labels_array[is_sliver[segments]] = 0
     labels_array[edges == 1] = EDGE_CLASS
 
     return labels_array, props
@@ -142,27 +206,30 @@ def make_crops_uniform(
 ) -> T.Tuple[np.ndarray, np.ndarray]:
     """Makes each segment uniform in its class value
     """
-    segments, num_objects = nd_label(np.uint8(edges == 0))
-    index = np.unique(segments)
-    crop_totals = nd_sum(np.uint8(labels_array > 0), labels=segments, index=index)
-    for lidx in range(0, len(index)):
-        lab = index[lidx]
-        if crop_totals[lidx] == 0:
-            # No cropland
-            labels_array[segments == lab] = 0
-        else:
-            seg_area = (segments == lab).sum()
-            crop_prop = crop_totals[lidx] / seg_area
-            if crop_prop > 0.5:
-                # Majority cropland
-                if data_type == 'boundaries':
-                    labels_array[segments == lab] = CROP_CLASS
-                else:
-                    idx = np.where(segments == lab)
-                    crop_pixels = labels_array[idx].flatten()
-                    labels_array[segments == lab] = sci_stats.mode(crop_pixels).mode[0]
-            else:
-                labels_array[segments == lab] = 0
+    segments, num_objects = label_segments(edges == 0)
+    segments_flat = segments.ravel()
+    # Per-segment areas and cropland totals in a single pass each
+    seg_areas = np.bincount(segments_flat, minlength=num_objects+1)
+    crop_totals = np.bincount(
+        segments_flat, weights=np.uint8(labels_array > 0).ravel(), minlength=num_objects+1
+    )
+    # Majority cropland
+    is_majority = crop_totals / np.maximum(seg_areas, 1) > 0.5
+    # The class value of each segment, indexed by segment label
+    segment_values = np.zeros(num_objects+1, dtype=labels_array.dtype)
+    if data_type == 'boundaries':
+        segment_values[is_majority] = CROP_CLASS
+    elif is_majority.any():
+        # Class histogram of each segment, ignoring non-crop pixels
+        num_classes = int(labels_array.max()) + 1
+        class_counts = np.bincount(
+            segments_flat.astype('int64') * num_classes + labels_array.ravel().astype('int64'),
+            minlength=(num_objects+1) * num_classes
+        ).reshape(num_objects+1, num_classes)
+        class_counts[:, 0] = 0
+        # The most frequent crop class
+        segment_values[is_majority] = class_counts[is_majority].argmax(axis=1)
+    labels_array = segment_values[segments]
 
     return labels_array, segments
 
@@ -204,54 +271,51 @@ def close_edge_ends(labels_array: np.ndarray) -> np.ndarray:
     """Closes 1 pixel gaps at image edges
     """
     # Top
-    idx = np.where(labels_array[1, :] == 1)
-    z = np.zeros(labels_array.shape[1], dtype='uint8')
-    z[idx] = 1
-    labels_array[0, :] = z
+    labels_array[0, :] = labels_array[1, :] == 1
     # Bottom
-    idx = np.where(labels_array[-1, :] == 1)
-    z = np.zeros(labels_array.shape[1], dtype='uint8')
-    z[idx] = 1
-    labels_array[-1, :] = z
+    labels_array[-1, :] = labels_array[-2, :] == 1
     # Left
-    idx = np.where(labels_array[:, 0] == 1)
-    z = np.zeros(labels_array.shape[0], dtype='uint8')
-    z[idx] = 1
-    labels_array[:, 0] = z
+    labels_array[:, 0] = labels_array[:, 1] == 1
     # Right
-    idx = np.where(labels_array[:, -1] == 1)
-    z = np.zeros(labels_array.shape[0], dtype='uint8')
-    z[idx] = 1
-    labels_array[:, -1] = z
+    labels_array[:, -1] = labels_array[:, -2] == 1
 
     return labels_array
 
 
 def is_grid_processed(
-    process_path: Path, transforms: T.List[str], group_id: str, grid: T.Union[str, int], n_ts: int
+    process_path: Path,
+    transforms: T.List[str],
+    group_id: str,
+    grid: T.Union[str, int],
+    n_ts: int,
+    processed_files: T.Optional[T.Set[str]] = None
 ) -> bool:
     """Checks if a grid is already processed
+
+    Args:
+        process_path: The main processing path.
+        transforms: A list of augmentation transforms.
+        group_id: A group identifier.
+        grid: The grid identifier.
+        n_ts: The number of temporal augmentations.
+        processed_files: The file names already stored in ``process_path``. If not given,
+            the directory is listed.
     """
-    batch_stored = False
+    if processed_files is None:
+        processed_files = {fn.name for fn in process_path.glob('data_*.pt')}
+
     for aug in transforms:
         if aug.startswith('ts-'):
             for i in range(0, n_ts):
                 train_id = f'{group_id}_{grid}_{aug}_{i:03d}'
-                train_path = process_path / f'data_{train_id}.pt'
-                if train_path.is_file():
-                    train_data = torch.load(train_path)
-                    if train_data.train_id == train_id:
-                        batch_stored = True
-
+                if f'data_{train_id}.pt' in processed_files:
+                    return True
         else:
             train_id = f'{group_id}_{grid}_{aug}'
-            train_path = process_path / f'data_{train_id}.pt'
-            if train_path.is_file():
-                train_data = torch.load(train_path)
-                if train_data.train_id == train_id:
-                    batch_stored = True
+            if f'data_{train_id}.pt' in processed_files:
+                return True
 
-    return batch_stored
+    return False
 
 
 def create_boundary_distances(
@@ -263,8 +327,11 @@ def create_boundary_distances(
         mask = np.uint8(labels_array)
     else:
         mask = np.uint8(1 - labels_array)
+    # Tiles without any segments have no distances to compute
+    if mask.max() == 0:
+        return mask, np.zeros(mask.shape, dtype='int32'), np.zeros(mask.shape, dtype='float32')
     # Get unique segments
-    segments, num_segments = nd_label(mask)
+    segments, num_segments = label_segments(mask)
     # Get the distance from edges
     bdist = cv2.distanceTransform(mask, cv2.DIST_L2, 3) * src_ts.gw.celly
 
@@ -279,24 +346,20 @@ def normalize_boundary_distances(
     # Create the boundary distances
     mask, segments, bdist = create_boundary_distances(labels_array, train_type, src_ts)
     # Normalize each segment by the local max distance
-    props = regionprops(segments, intensity_image=bdist)
-    for p in props:
-        if p.label > 0:
-            # Get the bounding box for the current label
-            min_row, min_col, max_row, max_col = p.bbox
-            label_slice = (
-                slice(min_row, max_row), slice(min_col, max_col)
-            )
-            # Get the window around the current segment
-            seg_label = segments[label_slice]
-            bdist_label = bdist[label_slice]
-            # Normalize the distance from edges
-            if (max_row - min_row <= 1) or (max_col - min_col <= 1):
-                bdist_label = np.where(seg_label == p.label, 0.1, bdist_label)
-            else:
-                bdist_label = np.where(seg_label == p.label, bdist_label / p.max_intensity, bdist_label)
-            # Update the segment
-            bdist[label_slice] = bdist_label
+    props = segment_props(segments)
+    labels = np.array([p.label for p in props], dtype='int64')
+    # Per-label lookups (label 0, the non-segment area, is left unchanged)
+    num_labels = int(segments.max()) + 1
+    seg_max_dists = np.ones(num_labels, dtype=bdist.dtype)
+    seg_max_dists[labels] = ndi.maximum(bdist, labels=segments, index=labels)
+    # Segments that are only 1 pixel wide or tall
+    is_thin = np.zeros(num_labels, dtype=bool)
+    is_thin[labels] = [
+        (max_row - min_row <= 1) or (max_col - min_col <= 1)
+        for min_row, min_col, max_row, max_col in (p.bbox for p in props)
+    ]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bdist = np.where(is_thin[segments], 0.1, bdist / seg_max_dists[segments])
     bdist = np.nan_to_num(bdist.clip(0, 1), nan=1.0, neginf=1.0, posinf=1.0)
 
     return bdist
@@ -327,7 +390,7 @@ def create_image_vars(
         ) as src_ts:
             # X variables
             time_series = ((src_ts.gw.compute(num_workers=num_workers) * gain + offset)
-                           .astype('float64')
+                           .astype('float32')
                            .clip(0, 1))
 
             # Get the band count per index
@@ -349,16 +412,13 @@ def create_image_vars(
                 # Calculate the focal variance
                 edge_compare_sum = focal_compare(labels_array)
                 # Get the field edges
-                edges = np.uint8(
-                    sk_thin(np.pad(
-                        # We expect edges to have < 8 neighbors that match the center pixel
-                        # edge_compare_sum = 9 -> homogenous neighbors
-                        # edge_compare_sum = 8 -> one corner
-                        # edge_compare_sum < 8 -> likely edge
-                        np.uint8((edge_compare_sum > 0) & (edge_compare_sum < 8)),
-                        pad_width=((1, 1), (1, 1)),
-                        mode='edge'
-                    ), max_num_iter=2))[1:-1, 1:-1]
+                edges = thin_edges(
+                    # We expect edges to have < 8 neighbors that match the center pixel
+                    # edge_compare_sum = 9 -> homogenous neighbors
+                    # edge_compare_sum = 8 -> one corner
+                    # edge_compare_sum < 8 -> likely edge
+                    np.uint8((edge_compare_sum > 0) & (edge_compare_sum < 8))
+                )
                 # Make the fields binary
                 labels_array[labels_array > 0] = CROP_CLASS
                 # Set edges
@@ -368,7 +428,9 @@ def create_image_vars(
                     (labels_array_copy == 0) & (labels_array != EDGE_CLASS), 0, labels_array
                 )
                 # Clean-up small fragments
-                frag_sum = focal_stat(np.array(labels_array == CROP_CLASS), stat='sum')
+                frag_sum = np.rint(
+                    ndi.uniform_filter(np.float32(labels_array == CROP_CLASS), size=3, mode='nearest') * 9
+                )
                 labels_array = np.where(
                     frag_sum < 2, 0, np.where(
                         frag_sum < 4, EDGE_CLASS, labels_array
@@ -383,13 +445,155 @@ def create_image_vars(
                     np.uint8(labels_array == 1), grid_edges.geom_type.values[0], src_ts
                 )
             else:
+                # The labels can be updated downstream, but the edges and distances are only read,
+                # so they share read-only zero views rather than allocating full arrays
                 labels_array = np.zeros((src_ts.gw.nrows, src_ts.gw.ncols), dtype='uint8')
-                bdist = np.zeros((src_ts.gw.nrows, src_ts.gw.ncols), dtype=time_series.dtype)
-                edges = np.zeros((src_ts.gw.nrows, src_ts.gw.ncols), dtype='uint8')
+                bdist = np.broadcast_to(np.zeros((), dtype=time_series.dtype), labels_array.shape)
+                edges = np.broadcast_to(np.zeros((), dtype='uint8'), labels_array.shape)
 
     return time_series, labels_array, edges, bdist, nbands
 
 
+def _init_grid_worker() -> None:
+    """Limits each grid process to one Numba thread, so processes do not oversubscribe the cores
+    """
+    numba.set_num_threads(1)
+
+
+def create_grid_data(
+    image_list: T.List[T.List[T.Union[str, Path]]],
+    grid_edges: T.Union[gpd.GeoDataFrame, None],
+    grid: T.Union[str, int],
+    ref_bounds: T.List[float],
+    latlon_bounds: T.List[float],
+    group_id: str = None,
+    process_path: Path = None,
+    transforms: T.List[str] = None,
+    gain: float = 0.0001,
+    offset: float = 0.0,
+    ref_res: float = 10.0,
+    resampling: str = 'nearest',
+    num_workers: int = 1,
+    lc_path: T.Optional[T.Union[str, None]] = None,
+    n_ts: T.Optional[int] = 2,
+    data_type: T.Optional[str] = 'boundaries'
+) -> str:
+    """Creates and stores the training data for a single grid
+
+    Args:
+        image_list: A list of images.
+        grid_edges: The training edges clipped to the grid, or ``None`` if the grid has no fields.
+        grid: The grid identifier.
+        ref_bounds: The grid bounds in the image CRS, as [left, bottom, right, top].
+        latlon_bounds: The grid bounds in lat/lon, as [left, bottom, right, top].
+        group_id: A group identifier, used for logging.
+        process_path: The main processing path.
+        transforms: A list of augmentation transforms to apply.
+        gain: A gain factor to apply to the images.
+        offset: An offset factor to apply to the images.
+        ref_res: The reference cell resolution to resample the images to.
+        resampling: The image resampling method.
+        num_workers: The number of dask workers.
+        lc_path: The land cover image path.
+        n_ts: The number of temporal augmentations.
+        data_type: The target data type.
+
+    Returns:
+        A status description, used for logging.
+    """
+    # Data for graph network
+    xvars, labels_array, edges, bdist, nbands = create_image_vars(
+        image_list,
+        bounds=ref_bounds,
+        num_workers=num_workers,
+        gain=gain,
+        offset=offset,
+        grid_edges=grid_edges,
+        ref_res=ref_res,
+        resampling=resampling
+    )
+
+    if (xvars.shape[1] < 5) or (xvars.shape[2] < 5):
+        return f'{group_id} is too small'
+
+    # Get the upper left lat/lon
+    left, bottom, right, top = latlon_bounds
+
+    if isinstance(group_id, str):
+        end_year = int(group_id.split('_')[-1])
+        start_year = end_year - 1
+    else:
+        start_year, end_year = None, None
+
+    # Get land cover over the block sample
+    if isinstance(lc_path, str) or isinstance(lc_path, Path):
+        # Convert the grid bounding box from lat/lon to projected coordinates
+        df_latlon = bounds_to_frame(left, bottom, right, top, crs='epsg:4326')
+        df_latlon, ref_crs = warp_by_image(df_latlon, lc_path)
+
+        # Open the projected land cover over the label window only
+        lc_left, __, __, lc_top = df_latlon.total_bounds.tolist()
+        nrows, ncols = labels_array.shape
+        lc_bounds = [lc_left, lc_top-ref_res*nrows, lc_left+ref_res*ncols, lc_top]
+        with gw.config.update(
+                ref_bounds=lc_bounds, ref_crs=ref_crs, ref_res=ref_res
+        ):
+            with gw.open(lc_path, chunks=max(nrows, ncols)) as src:
+                lc_labels = src.squeeze()[:nrows, :ncols].values
+
+        # Close ends
+        labels_array = close_edge_ends(labels_array)
+        # Recode crop labels
+        labels_array, edges = recode_crop_labels(
+            labels_array, lc_labels, lc_is_cdl=True, data_type=data_type
+        )
+        # Make each segment uniform in its class value
+        labels_array, segments = make_crops_uniform(labels_array, edges, data_type=data_type)
+        # Check for slivers
+        labels_array, props = check_slivers(labels_array, edges, segments)
+        # Remove non-crop edges
+        xvars, labels_array = remove_noncrop(xvars, labels_array)
+    else:
+        segments, num_objects = label_segments(labels_array > 0)
+        props = segment_props(segments)
+
+    ldata = LabeledData(
+        x=xvars, y=labels_array, bdist=bdist, segments=segments, props=props
+    )
+
+    def save_data(train_data: Data) -> None:
+        train_path = process_path / f'data_{train_data.train_id}.pt'
+        # Many small samples are written, so skip the zip container overhead
+        torch.save(
+            train_data, train_path, pickle_protocol=5, _use_new_zipfile_serialization=False
+        )
+
+    for aug in transforms:
+        if aug.startswith('ts-'):
+            for i in range(0, n_ts):
+                train_id = f'{group_id}_{grid}_{aug}_{i:03d}'
+                train_data = augment(
+                    ldata, aug=aug, nbands=nbands, k=3,
+                    start_year=start_year, end_year=end_year,
+                    left=left, bottom=bottom, right=right, top=top,
+                    res=ref_res, train_id=train_id
+                )
+
+                save_data(train_data)
+        else:
+            train_id = f'{group_id}_{grid}_{aug}'
+            train_data = augment(
+                ldata, aug=aug, nbands=nbands, k=3,
+                start_year=start_year, end_year=end_year,
+                left=left, bottom=bottom, right=right, top=top,
+                res=ref_res, train_id=train_id
+            )
+
+            save_data(train_data)
+
+    return group_id
+
+
 def create_dataset(
     image_list: T.List[T.List[T.Union[str, Path]]],
     df_grids: gpd.GeoDataFrame,
@@ -420,7 +624,9 @@ def create_dataset(
         offset: An offset factor to apply to the images.
         ref_res: The reference cell resolution to resample the images to.
         resampling: The image resampling method.
-        num_workers: The number of dask workers.
+        num_workers: The number of grid processes. If > 1, grids are created in parallel in a
+            pool of ``num_workers`` spawned processes, each with one dask worker and one Numba
+            thread. If 1, grids are created sequentially with a single dask worker.
         grid_size: The requested grid size, in (rows, columns) or (height, width).
         lc_path: The land cover image path.
         n_ts: The number of temporal augmentations.
@@ -435,7 +641,15 @@ def create_dataset(
     # Get the image CRS
     with gw.open(image_list[0]) as src:
         image_crs = src.crs
+    # Project the grids once, rather than for every grid
+    df_grids_img = df_grids.to_crs(image_crs)
+    df_grids_ll = df_grids.to_crs('epsg:4326')
+
+    # List the stored files once rather than checking each grid on disk
+    processed_files = {fn.name for fn in process_path.glob('data_*.pt')}
 
+    # Check each grid (sequentially, since grids can be merged with their neighbors)
+    grid_tasks = []
     with tqdm(total=df_grids.shape[0], desc='Check') as pbar:
         for row in df_grids.itertuples():
             # Clip the edges to the current grid
@@ -470,113 +684,75 @@ def create_dataset(
                     grid_edges = gpd.clip(df_edges, df_grids.iloc[int_idx].geometry)
                     merged_grids.append(row.grid)
 
+                # Check if the grid has already been saved
+                batch_stored = is_grid_processed(
+                    process_path, transforms, group_id, row.grid, n_ts, processed_files=processed_files
+                )
+                if batch_stored:
+                    pbar.update(1)
+                    pbar.set_description(f'{group_id} is already stored.')
+                    continue
+
                 # Make polygons unique
-                nonzero_mask = grid_edges['class'] != 0
-                if nonzero_mask.any():
-                    grid_edges.loc[nonzero_mask, 'class'] = range(1, nonzero_mask.sum()+1)
+                nonzero_mask = grid_edges['class'].to_numpy() != 0
+                num_fields = int(nonzero_mask.sum())
+                if num_fields > 0:
+                    grid_edges.loc[nonzero_mask, 'class'] = np.arange(1, num_fields+1, dtype='int32')
 
                 # left, bottom, right, top
-                ref_bounds = df_grids.to_crs(image_crs).iloc[int_idx].total_bounds.tolist()
+                ref_bounds = df_grids_img.iloc[int_idx].total_bounds.tolist()
                 if grid_size is not None:
                     height, width = grid_size
                     left, bottom, right, top = ref_bounds
                     ref_bounds = [left, top-ref_res*height, left+ref_res*width, top]
 
-                # Data for graph network
-                xvars, labels_array, edges, bdist, nbands = create_image_vars(
-                    image_list,
-                    bounds=ref_bounds,
-                    num_workers=num_workers,
-                    gain=gain,
-                    offset=offset,
-                    grid_edges=grid_edges if nonzero_mask.any() else None,
-                    ref_res=ref_res,
-                    resampling=resampling
-                )
-
-                if (xvars.shape[1] < 5) or (xvars.shape[2] < 5):
-                    pbar.update(1)
-                    pbar.set_description(f'{group_id} is too small')
-                    continue
-
-                # Check if the grid has already been saved
-                batch_stored = is_grid_processed(process_path, transforms, group_id, row.grid, n_ts)
-                if batch_stored:
-                    pbar.update(1)
-                    pbar.set_description(f'{group_id} is already stored.')
-                    continue
-
-                # Get the upper left lat/lon
-                left, bottom, right, top = (df_grids.iloc[int_idx]
-                                            .to_crs('epsg:4326')
-                                            .total_bounds
-                                            .tolist())
-
-                if isinstance(group_id, str):
-                    end_year = int(group_id.split('_')[-1])
-                    start_year = end_year - 1
-                else:
-                    start_year, end_year = None, None
-
-                # Get land cover over the block sample
-                if isinstance(lc_path, str) or isinstance(lc_path, Path):
-                    # Convert the grid bounding box from lat/lon to projected coordinates
-                    df_latlon = bounds_to_frame(left, bottom, right, top, crs='epsg:4326')
-                    df_latlon, ref_crs = warp_by_image(df_latlon, lc_path)
-
-                    # Open the projected land cover
-                    with gw.config.update(
-                            ref_bounds=df_latlon.total_bounds.tolist(), ref_crs=ref_crs, ref_res=ref_res
-                    ):
-                        with gw.open(lc_path, chunks=2048) as src:
-                            lc_labels = src.squeeze()[:labels_array.shape[0], :labels_array.shape[1]].data.compute()
-
-                    # Close ends
-                    labels_array = close_edge_ends(labels_array)
-                    # Recode crop labels
-                    labels_array, edges = recode_crop_labels(
-                        labels_array, lc_labels, lc_is_cdl=True, data_type=data_type
+                grid_tasks.append(
+                    dict(
+                        grid_edges=grid_edges if num_fields > 0 else None,
+                        grid=row.grid,
+                        ref_bounds=ref_bounds,
+                        latlon_bounds=df_grids_ll.iloc[int_idx].total_bounds.tolist()
                     )
-                    # Make each segment uniform in its class value
-                    labels_array, segments = make_crops_uniform(labels_array, edges, data_type=data_type)
-                    # Check for slivers
-                    labels_array, props = check_slivers(labels_array, edges, segments)
-                    # Remove non-crop edges
-                    xvars, labels_array = remove_noncrop(xvars, labels_array)
-                else:
-                    segments, num_objects = nd_label(labels_array)
-                    props = regionprops(segments)
-
-                ldata = LabeledData(
-                    x=xvars, y=labels_array, bdist=bdist, segments=segments, props=props
                 )
 
-                def save_and_update(train_data: Data) -> None:
-                    train_path = process_path / f'data_{train_data.train_id}.pt'
-                    torch.save(train_data, train_path)
-
-                for aug in transforms:
-                    if aug.startswith('ts-'):
-                        for i in range(0, n_ts):
-                            train_id = f'{group_id}_{row.grid}_{aug}_{i:03d}'
-                            train_data = augment(
-                                ldata, aug=aug, nbands=nbands, k=3,
-                                start_year=start_year, end_year=end_year,
-                                left=left, bottom=bottom, right=right, top=top,
-                                res=ref_res, train_id=train_id
-                            )
-
-                            save_and_update(train_data)
-                    else:
-                        train_id = f'{group_id}_{row.grid}_{aug}'
-                        train_data = augment(
-                            ldata, aug=aug, nbands=nbands, k=3,
-                            start_year=start_year, end_year=end_year,
-                            left=left, bottom=bottom, right=right, top=top,
-                            res=ref_res, train_id=train_id
-                        )
-
-                        save_and_update(train_data)
-
             pbar.update(1)
             pbar.set_description(group_id)
+
+    task_kwargs = dict(
+        image_list=image_list,
+        group_id=group_id,
+        process_path=process_path,
+        transforms=transforms,
+        gain=gain,
+        offset=offset,
+        ref_res=ref_res,
+        resampling=resampling,
+        lc_path=lc_path,
+        n_ts=n_ts,
+        data_type=data_type
+    )
+
+    # Create and store the data for each grid
+    with tqdm(total=len(grid_tasks), desc='Create') as pbar:
+        if (num_workers > 1) and (len(grid_tasks) > 1):
+            # Each grid is written to its own files, so grids are processed in parallel.
+            # Each process reads with a single dask worker and runs the Numba kernels on a
+            # single thread, so the two levels do not compete. Processes are spawned rather
+            # than forked from a parent that already runs tqdm and dask threads.
+            with ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_grid_worker
+            ) as executor:
+                futures = [
+                    executor.submit(create_grid_data, **grid_task, num_workers=1, **task_kwargs)
+                    for grid_task in grid_tasks
+                ]
+                for future in as_completed(futures):
+                    pbar.update(1)
+                    pbar.set_description(future.result())
+        else:
+            for grid_task in grid_tasks:
+                status = create_grid_data(**grid_task, num_workers=num_workers, **task_kwargs)
+                pbar.update(1)
+                pbar.set_description(status)
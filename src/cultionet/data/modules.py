@@ -17,7 +17,8 @@ class EdgeDataModule(pl.LightningDataModule):
         predict_ds: T.Optional[EdgeDataset] = None,
         batch_size: int = 5,
         num_workers: int = 0,
-        shuffle: bool = True
+        shuffle: bool = True,
+        pin_memory: bool = False
     ):
         super().__init__()
 
@@ -28,6 +29,7 @@ class EdgeDataModule(pl.LightningDataModule):
         self.batch_size = batch_size
         self.num_workers = num_workers
         self.shuffle = shuffle
+        self.pin_memory = pin_memory
 
     def train_dataloader(self):
         """Returns a data loader for train data
@@ -36,7 +38,8 @@ class EdgeDataModule(pl.LightningDataModule):
             self.train_ds,
             batch_size=self.batch_size,
             shuffle=self.shuffle,
-            num_workers=self.num_workers
+            num_workers=self.num_workers,
+            pin_memory=self.pin_memory
         )
 
     def val_dataloader(self):
@@ -46,7 +49,8 @@ class EdgeDataModule(pl.LightningDataModule):
             self.val_ds,
             batch_size=self.batch_size,
             shuffle=self.shuffle,
-            num_workers=self.num_workers
+            num_workers=self.num_workers,
+            pin_memory=self.pin_memory
         )
 
     def test_dataloader(self):
@@ -56,7 +60,8 @@ class EdgeDataModule(pl.LightningDataModule):
             self.test_ds,
             batch_size=self.batch_size,
             shuffle=self.shuffle,
-            num_workers=self.num_workers
+            num_workers=self.num_workers,
+            pin_memory=self.pin_memory
         )
 
     def predict_dataloader(self):
@@ -66,5 +71,6 @@ class EdgeDataModule(pl.LightningDataModule):
             self.predict_ds,
             batch_size=self.batch_size,
             shuffle=self.shuffle,
-            num_workers=self.num_workers
+            num_workers=self.num_workers,
+            pin_memory=self.pin_memory
         )
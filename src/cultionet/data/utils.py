@@ -14,6 +14,13 @@ import torch
 from torch_geometric.data import Data
 
 
+@dataclass
+class SegmentProps:
+    label: int
+    bbox: T.Tuple[int, int, int, int]
+    area: int
+
+
 @dataclass
 class LabeledData:
     x: np.ndarray
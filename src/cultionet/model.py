@@ -72,7 +72,8 @@ def fit(
         val_ds=val_ds,
         batch_size=batch_size,
         num_workers=0,
-        shuffle=True
+        shuffle=True,
+        pin_memory=device == 'gpu'
     )
 
     # Setup the Lightning model
@@ -175,7 +176,7 @@ def predict(
     ckpt_file = Path(ckpt_file)
 
     data_module = EdgeDataModule(
-        predict_ds=predict_ds, batch_size=1, num_workers=0
+        predict_ds=predict_ds, batch_size=1, num_workers=0, pin_memory=device == 'gpu'
     )
 
     trainer_kwargs = dict(
@@ -165,7 +165,7 @@ class StarRNN(torch.nn.Module):
         # convRNN step
         # hidden_s is a list (number of layer) of hidden states of size [b x c x h x w]
         if hidden_s is None:
-            hidden_s = [torch.zeros((b, self.hidden_dim, h, w))] * self.n_layers
+            hidden_s = [x.new_zeros((b, self.hidden_dim, h, w))] * self.n_layers
 
         if torch.cuda.is_available():
             for i in range(self.n_layers):
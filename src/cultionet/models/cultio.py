@@ -4,10 +4,11 @@ from . import model_utils
 from .nunet import NestedUNet
 from .convstar import StarRNN
 
-import numpy as np
 import torch
+from torch.utils.checkpoint import checkpoint
 from torch_geometric.data import Data
 from torch_geometric import nn
+from torch_geometric.nn.conv.gcn_conv import gcn_norm
 
 
 class CultioGraphNet(torch.nn.Module):
@@ -19,6 +20,16 @@ class CultioGraphNet(torch.nn.Module):
         filters (int): The number of output filters for each stream.
         num_classes (int): The number of output classes.
         dropout (Optional[float]): The dropout fraction for the transformer stream.
+        compile_model (Optional[bool]): Whether to compile the forward pass with ``torch.compile``.
+        compile_mode (Optional[str]): The ``torch.compile`` mode.
+        use_checkpoint (Optional[bool]): Whether to recompute the stream activations on the backward pass
+            during training, trading compute for memory.
+        amp_dtype (Optional[torch.dtype]): The autocast data type (e.g., ``torch.bfloat16``). If ``None``,
+            the model runs in full precision.
+        cuda_graph (Optional[bool]): Whether to capture CUDA graphs of the inference forward pass. A graph is
+            captured for each new set of input shapes and replayed for later inputs with the same shapes.
+        compile_shapes (Optional[Sequence[Tuple[int, int]]]): Grid (height, width) sizes to compile
+            shape-specialized nested UNets for. Other sizes run the nested UNet eagerly.
     """
     def __init__(
         self,
@@ -26,24 +37,45 @@ class CultioGraphNet(torch.nn.Module):
         ds_time_features: int,
         filters: int = 32,
         num_classes: int = 2,
-        dropout: T.Optional[float] = 0.1
+        dropout: T.Optional[float] = 0.1,
+        compile_model: T.Optional[bool] = False,
+        compile_mode: T.Optional[str] = 'reduce-overhead',
+        use_checkpoint: T.Optional[bool] = False,
+        amp_dtype: T.Optional[torch.dtype] = None,
+        cuda_graph: T.Optional[bool] = False,
+        compile_shapes: T.Optional[T.Sequence[T.Tuple[int, int]]] = ()
     ):
         super(CultioGraphNet, self).__init__()
 
+        if sum([bool(compile_model), bool(cuda_graph), bool(compile_shapes)]) > 1:
+            raise ValueError('Only one of compile_model, cuda_graph, or compile_shapes can be used.')
+
         self.ds_features = ds_features
         self.ds_time_features = ds_time_features
         self.num_indices = int(self.ds_features / self.ds_time_features)
         self.filters = filters
+        self.use_checkpoint = use_checkpoint
+        self.amp_dtype = amp_dtype
+        self.cuda_graph = cuda_graph
+        self.compile_model = compile_model
+        self.compile_mode = compile_mode
+        self.compile_shapes = [(int(nrows), int(ncols)) for nrows, ncols in compile_shapes]
+        # The latest captured CUDA graph, keyed by the input shapes
+        self._cuda_graphs = {}
         num_quantiles = 3
         num_index_streams = 2
         base_in_channels = (filters * self.num_indices) * num_index_streams + self.filters
+        # Input channels of the final (class) layer
+        self.num_stack_channels = base_in_channels + num_quantiles + num_classes
 
-        self.gc = model_utils.GraphToConv()
+        self.gtc = model_utils.GraphToTimeConv()
         self.cg = model_utils.ConvToGraph()
 
         # Transformer stream (+self.filters x self.num_indices)
         self.transformer = self.mid_sequence_weights(
-            nn.TransformerConv(self.ds_time_features, self.filters, heads=1, edge_dim=2, dropout=dropout)
+            model_utils.BandTransformerConv(
+                self.ds_time_features, self.filters, self.num_indices, edge_dim=2, dropout=dropout
+            )
         )
 
         # Nested UNet (+self.filters x self.num_indices)
@@ -55,29 +87,71 @@ class CultioGraphNet(torch.nn.Module):
             n_layers=4
         )
 
+        # The final graph convolutions share an adjacency normalized once per forward pass
         # Boundary distances (+num_quantiles) (0.1, 0.5, 0.9)
         self.dist_layer = self.final_sequence_weights(
-            nn.GCNConv(base_in_channels, self.filters, improved=True),
+            nn.GCNConv(base_in_channels, self.filters, normalize=False),
             nn.TransformerConv(self.filters, self.filters, heads=1, edge_dim=2, dropout=0.1),
             self.filters, num_quantiles
         )
 
         # Edges (+num_classes)
         self.edge_layer = self.final_sequence_weights_logits(
-            nn.GCNConv(base_in_channels+num_quantiles, self.filters, improved=True),
+            nn.GCNConv(base_in_channels+num_quantiles, self.filters, normalize=False),
             nn.TransformerConv(self.filters, num_classes, heads=1, edge_dim=2, dropout=0.1),
             self.filters, num_classes
         )
 
         # Classes (+num_classes)
         self.class_layer = self.final_sequence_weights_logits(
-            nn.GCNConv(base_in_channels+num_quantiles+num_classes, self.filters, improved=True),
+            nn.GCNConv(base_in_channels+num_quantiles+num_classes, self.filters, normalize=False),
             nn.TransformerConv(
                 self.filters, num_classes, heads=1, edge_dim=2, dropout=0.1
             ),
             self.filters, num_classes
         )
 
+        self._compile()
+
+    def _compile(self) -> None:
+        """Compiles the forward pass or the shape-specialized nested UNets
+
+        The compiled callables are not picklable, so they are dropped when the model is
+        pickled and rebuilt when it is loaded.
+        """
+        # Shape-specialized nested UNets, keyed by (height, width). The compiled
+        # modules share the parameters of self.nunet and are not registered as submodules.
+        self._compiled_nunet = {}
+        if self.compile_shapes:
+            # Each shape (and a differently sized last batch) is a separate graph
+            torch._dynamo.config.cache_size_limit = max(
+                torch._dynamo.config.cache_size_limit, len(self.compile_shapes) * 2
+            )
+            for nrows, ncols in self.compile_shapes:
+                self._compiled_nunet[(nrows, ncols)] = torch.compile(
+                    self.nunet, mode='max-autotune', dynamic=False
+                )
+
+        if self.compile_model:
+            # Allow TF32 matrix multiplications for the compiled kernels
+            torch.set_float32_matmul_precision('high')
+            # Shadows the _forward_core method on the instance
+            self._forward_core = torch.compile(
+                CultioGraphNet._forward_core.__get__(self), mode=self.compile_mode
+            )
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state.pop('_forward_core', None)
+        state['_compiled_nunet'] = {}
+        state['_cuda_graphs'] = {}
+
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        super(CultioGraphNet, self).__setstate__(state)
+        self._compile()
+
     @staticmethod
     def mid_sequence_weights(conv: T.Callable) -> nn.Sequential:
         return nn.Sequential('x, edge_index, edge_weight',
@@ -90,25 +164,24 @@ class CultioGraphNet(torch.nn.Module):
     def final_sequence_weights(
         conv1: T.Callable, conv2: T.Callable, mid_channels: int, out_channels: int
     ) -> nn.Sequential:
-        return nn.Sequential('x, edge_index, edge_weight, edge_weight2d',
+        return nn.Sequential('x, edge_index, edge_weight2d, gcn_edge_index, gcn_edge_weight',
                              [
-                                 (conv1, 'x, edge_index, edge_weight -> x'),
-                                 (nn.BatchNorm(in_channels=mid_channels), 'x -> x'),
+                                 (conv1, 'x, gcn_edge_index, gcn_edge_weight -> x'),
+                                 (torch.nn.LayerNorm(mid_channels), 'x -> x'),
                                  (conv2, 'x, edge_index, edge_weight2d -> x'),
-                                 (nn.BatchNorm(in_channels=mid_channels), 'x -> x'),
-                                 (torch.nn.ELU(alpha=0.1, inplace=False), 'x -> x'),
-                                 (torch.nn.Linear(mid_channels, out_channels), 'x -> x')
+                                 (model_utils.LayerNormELULinear(mid_channels, out_channels), 'x -> x')
                              ])
 
     @staticmethod
     def final_sequence_weights_logits(
         conv1: T.Callable, conv2: T.Callable, mid_channels: int, out_channels: int
     ) -> nn.Sequential:
-        return nn.Sequential('x, edge_index, edge_weight, edge_weight2d',
+        return nn.Sequential('x, edge_index, edge_weight2d, gcn_edge_index, gcn_edge_weight',
                              [
-                                 (conv1, 'x, edge_index, edge_weight -> x'),
-                                 (nn.BatchNorm(in_channels=mid_channels), 'x -> x'),
+                                 (conv1, 'x, gcn_edge_index, gcn_edge_weight -> x'),
+                                 (torch.nn.LayerNorm(mid_channels), 'x -> x'),
                                  (conv2, 'x, edge_index, edge_weight2d -> x'),
+                                 # Layer normalization over the class logits would discard their scale
                                  (nn.BatchNorm(in_channels=out_channels), 'x -> x'),
                                  (torch.nn.ELU(alpha=0.1, inplace=False), 'x -> x')
                              ])
@@ -116,73 +189,232 @@ class CultioGraphNet(torch.nn.Module):
     def __call__(self, *args, **kwargs):
         return self.forward(*args, **kwargs)
 
+    def reset_cuda_graphs(self) -> None:
+        """Releases the captured CUDA graphs and their static buffers
+        """
+        self._cuda_graphs.clear()
+
+    def _apply(self, *args, **kwargs):
+        # Captured graphs read the old parameter storage after a device or dtype change
+        self.reset_cuda_graphs()
+
+        return super(CultioGraphNet, self)._apply(*args, **kwargs)
+
+    def train(self, mode: bool = True):
+        self.reset_cuda_graphs()
+
+        return super(CultioGraphNet, self).train(mode)
+
+    def run_stream(self, stream: T.Callable, *args) -> torch.Tensor:
+        """Runs a stream, recomputing its activations on the backward pass if checkpointing
+        """
+        if self.use_checkpoint and self.training:
+            return checkpoint(stream, *args, use_reentrant=False)
+
+        return stream(*args)
+
+    def transformer_stream(
+        self, x_series: torch.Tensor, edge_index: torch.Tensor, edge_attrs: torch.Tensor
+    ) -> torch.Tensor:
+        return self.transformer(x_series, edge_index, edge_attrs)
+
+    def nunet_stream(
+        self,
+        x_bands: torch.Tensor,
+        edge_index_bands: torch.Tensor,
+        edge_weight_bands: torch.Tensor,
+        nbatch_bands: int,
+        nrows: int,
+        ncols: int
+    ) -> torch.Tensor:
+        nunet = self._compiled_nunet.get((nrows, ncols), self.nunet)
+        nunet_stream = nunet(
+            x_bands, edge_index_bands, edge_weight_bands, nbatch_bands, nrows, ncols
+        )
+
+        return model_utils.graphs_to_bands(nunet_stream, self.num_indices)
+
+    def star_stream(self, x_series: torch.Tensor, nbatch: int, nrows: int, ncols: int) -> torch.Tensor:
+        # Reshape from (N x C x T) -> (B x T x C x H x W)
+        star_stream = self.gtc(x_series, nbatch, nrows, ncols)
+        star_stream = self.star_rnn(star_stream)
+
+        return self.cg(star_stream)
+
     def forward(self, data: Data) -> T.Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
-        # Transformer on each band time series
-        transformer_stream = []
-        for band in range(0, self.ds_features, self.ds_time_features):
-            t = self.transformer(
-                data.x[:, band:band+self.ds_time_features], data.edge_index, data.edge_attrs
-            )
-            transformer_stream.append(t)
-        transformer_stream = torch.cat(transformer_stream, dim=1)
-
-        # Nested UNet on each band time series
-        nunet_stream = []
-        for band in range(0, self.ds_features, self.ds_time_features):
-            t = self.nunet(
-                data.x[:, band:band+self.ds_time_features],
-                data.edge_index,
-                data.edge_attrs[:, 1],
-                data.batch,
-                int(data.height[0]),
-                int(data.width[0])
+        # Shapes are taken as Python ints outside of the (optionally compiled) core
+        nbatch, nrows, ncols = model_utils.get_batch_shape(data)
+        use_cuda_graph = (
+            self.cuda_graph and data.x.is_cuda and not self.training and not torch.is_grad_enabled()
+        )
+
+        # Graph preparation has data-dependent shapes, so it runs outside of the core
+        inputs = (data.x, data.edge_index, data['edge_attrs']) + self.prepare_graph(
+            data.edge_index, self.get_edge_weight(data), data.x.shape[0], use_adj_t=not use_cuda_graph
+        )
+
+        with torch.autocast(
+            device_type=data.x.device.type,
+            dtype=self.amp_dtype,
+            enabled=self.amp_dtype is not None,
+            # Cached casts cannot be reused across CUDA graph replays
+            cache_enabled=not use_cuda_graph
+        ):
+            if use_cuda_graph:
+                logits_distances, logits_edges, logits_labels = self.replay_cuda_graph(
+                    inputs, nbatch, nrows, ncols
+                )
+            else:
+                logits_distances, logits_edges, logits_labels = self._forward_core(
+                    *inputs, nbatch, nrows, ncols
+                )
+
+        # Return full precision outputs for the losses
+        return logits_distances.float(), logits_edges.float(), logits_labels.float()
+
+    @staticmethod
+    def get_edge_weight(data: Data) -> torch.Tensor:
+        """Gets the contiguous graph convolution edge weights, stored by the dataset as ``edge_w1``
+        """
+        edge_w = getattr(data, 'edge_w1', None)
+        if edge_w is None:
+            edge_w = data['edge_attrs'][:, 1].contiguous()
+
+        return edge_w
+
+    def prepare_graph(
+        self, edge_index: torch.Tensor, edge_w: torch.Tensor, num_nodes: int, use_adj_t: bool = True
+    ) -> T.Tuple[T.Any, T.Optional[torch.Tensor], torch.Tensor, torch.Tensor]:
+        """Prepares the normalized graph convolution edges
+
+        Returns:
+            The normalized edges (or sparse adjacency) of the final layers and the normalized
+            band-stacked edges of the nested UNet.
+        """
+        # Normalize the adjacency once for the final graph convolutions
+        gcn_edge_index, gcn_edge_weight = gcn_norm(
+            edge_index, edge_w, num_nodes=num_nodes, improved=True, add_self_loops=True
+        )
+        if use_adj_t:
+            gcn_edge_index, gcn_edge_weight = model_utils.to_adj_t(
+                gcn_edge_index, gcn_edge_weight, num_nodes
             )
-            nunet_stream.append(t)
-        nunet_stream = torch.cat(nunet_stream, dim=1)
+        # Stack the edges for the band time series as disjoint graphs
+        edge_index_bands, edge_w_bands = model_utils.repeat_edges(
+            edge_index, edge_w, num_nodes, self.num_indices
+        )
+        # Normalize the adjacency once for the nested UNet graph convolutions
+        edge_index_bands, edge_w_bands = gcn_norm(
+            edge_index_bands,
+            edge_w_bands,
+            num_nodes=num_nodes*self.num_indices,
+            improved=True,
+            add_self_loops=True
+        )
+
+        return gcn_edge_index, gcn_edge_weight, edge_index_bands, edge_w_bands
+
+    def replay_cuda_graph(
+        self, inputs: T.Sequence[torch.Tensor], nbatch: int, nrows: int, ncols: int
+    ) -> T.Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Replays the core forward pass from a CUDA graph captured for the input shapes
+        """
+        key = tuple((tuple(t.shape), t.dtype) for t in inputs) + (nbatch, nrows, ncols)
+        if key not in self._cuda_graphs:
+            # Each graph holds its own memory pool, so only the latest shapes are kept
+            self.reset_cuda_graphs()
+            static_inputs = [t.clone() for t in inputs]
+            # Warm up on a side stream before capturing
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for __ in range(2):
+                    self._forward_core(*static_inputs, nbatch, nrows, ncols)
+            torch.cuda.current_stream().wait_stream(stream)
+
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                static_outputs = self._forward_core(*static_inputs, nbatch, nrows, ncols)
+            self._cuda_graphs[key] = (graph, static_inputs, static_outputs)
 
+        graph, static_inputs, static_outputs = self._cuda_graphs[key]
+        for static_input, t in zip(static_inputs, inputs):
+            static_input.copy_(t)
+        graph.replay()
+
+        # The static outputs are overwritten by the next replay
+        return tuple(t.clone() for t in static_outputs)
+
+    def _forward_core(
+        self,
+        x: torch.Tensor,
+        edge_index: torch.Tensor,
+        edge_attrs: torch.Tensor,
+        gcn_edge_index: T.Any,
+        gcn_edge_weight: T.Optional[torch.Tensor],
+        edge_index_bands: torch.Tensor,
+        edge_w_bands: torch.Tensor,
+        nbatch: int,
+        nrows: int,
+        ncols: int
+    ) -> T.Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        # (N x bands*time) -> (N x bands x time), a view of the band time series
+        x_series = x.view(x.shape[0], self.num_indices, self.ds_time_features)
+
+        # Transformer on each band time series
+        transformer_stream = self.run_stream(
+            self.transformer_stream, x_series, edge_index, edge_attrs
+        )
+        # Nested UNet on each band time series, with bands stacked as disjoint graphs
+        # and folded into the batch
+        nunet_stream = self.run_stream(
+            self.nunet_stream,
+            model_utils.bands_to_graphs(x_series, self.num_indices),
+            edge_index_bands,
+            edge_w_bands,
+            nbatch*self.num_indices,
+            nrows,
+            ncols
+        )
         # RNN ConvStar
-        # Reshape from (B x C x H x W) -> (B x T x C x H x W)
-        star_stream = self.gc(
-            data.x, data.batch.unique().size(0), int(data.height[0]), int(data.width[0])
-        )
-        nbatch, ntime, height, width = star_stream.shape
-        star_stream = star_stream.reshape(
-            nbatch, self.num_indices, self.ds_time_features, height, width
-        ).permute(0, 2, 1, 3, 4)
-        star_stream = self.star_rnn(star_stream)
-        star_stream = self.cg(star_stream)
+        star_stream = self.run_stream(self.star_stream, x_series, nbatch, nrows, ncols)
 
         # Concatenate streams
-        h = torch.cat([transformer_stream, nunet_stream, star_stream], dim=1)
+        h = model_utils.FeatureStack(
+            [transformer_stream, nunet_stream, star_stream], self.num_stack_channels
+        )
 
         # Estimate distance from edges
         logits_distances = self.dist_layer(
-            h,
-            data.edge_index,
-            data.edge_attrs[:, 1],
-            data.edge_attrs
+            h.h,
+            edge_index,
+            edge_attrs,
+            gcn_edge_index,
+            gcn_edge_weight
         )
 
         # Concatenate streams + distances
-        h = torch.cat([h, logits_distances], dim=1)
+        h.append(logits_distances)
 
         # Estimate edges
         logits_edges = self.edge_layer(
-            h,
-            data.edge_index,
-            data.edge_attrs[:, 1],
-            data.edge_attrs
+            h.h,
+            edge_index,
+            edge_attrs,
+            gcn_edge_index,
+            gcn_edge_weight
         )
 
         # Concatenate streams + distances + edges
-        h = torch.cat([h, logits_edges], dim=1)
+        h.append(logits_edges)
 
         # Estimate all classes
         logits_labels = self.class_layer(
-            h,
-            data.edge_index,
-            data.edge_attrs[:, 1],
-            data.edge_attrs
+            h.h,
+            edge_index,
+            edge_attrs,
+            gcn_edge_index,
+            gcn_edge_weight
         )
 
         return logits_distances, logits_edges, logits_labels
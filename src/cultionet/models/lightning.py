@@ -1,5 +1,6 @@
 import typing as T
 
+from . import model_utils
 from .cultio import CultioGraphNet
 from .refinement import RefineConv
 from ..losses import QuantileLoss, TanimotoDistanceLoss, F1Score, MatthewsCorrcoef
@@ -26,7 +27,13 @@ class CultioLitModel(pl.LightningModule):
         num_time_features: int = None,
         filters: int = 32,
         learning_rate: float = 0.001,
-        weight_decay: float = 1e-5
+        weight_decay: float = 1e-5,
+        compile_model: bool = False,
+        compile_mode: str = 'reduce-overhead',
+        use_checkpoint: bool = False,
+        amp_dtype: T.Optional[torch.dtype] = None,
+        cuda_graph: bool = False,
+        compile_shapes: T.Sequence[T.Tuple[int, int]] = ()
     ):
         """Lightning model
 
@@ -36,6 +43,12 @@ class CultioLitModel(pl.LightningModule):
             filters
             learning_rate
             weight_decay
+            compile_model
+            compile_mode
+            use_checkpoint
+            amp_dtype
+            cuda_graph
+            compile_shapes
         """
         super(CultioLitModel, self).__init__()
 
@@ -50,7 +63,13 @@ class CultioLitModel(pl.LightningModule):
             ds_features=num_features,
             ds_time_features=num_time_features,
             filters=filters,
-            num_classes=self.num_classes
+            num_classes=self.num_classes,
+            compile_model=compile_model,
+            compile_mode=compile_mode,
+            use_checkpoint=use_checkpoint,
+            amp_dtype=amp_dtype,
+            cuda_graph=cuda_graph,
+            compile_shapes=compile_shapes
         )
 
         self.refine = RefineConv(
@@ -82,9 +101,7 @@ class CultioLitModel(pl.LightningModule):
             torch.cat([
                 distance, F.log_softmax(edge, dim=1), F.log_softmax(crop, dim=1)
             ], dim=1),
-            batch.batch.unique().size(0),
-            int(batch.height[0]),
-            int(batch.width[0])
+            *model_utils.get_batch_shape(batch)
         )
 
         # Transform edge and crop logits to probabilities
@@ -94,6 +111,21 @@ class CultioLitModel(pl.LightningModule):
 
         return distance, edge, crop, crop_r
 
+    def on_before_batch_transfer(self, batch: Data, dataloader_idx: int) -> Data:
+        """Stores the batch shape as Python ints while the batch is still on the host
+        """
+        batch.batch_shape = (batch.num_graphs, int(batch.height[0]), int(batch.width[0]))
+
+        return batch
+
+    def transfer_batch_to_device(self, batch: Data, device: torch.device, dataloader_idx: int) -> Data:
+        """Moves a batch to the device, without blocking if the loader memory is pinned
+        """
+        if isinstance(batch, Data):
+            return batch.to(device, non_blocking=True)
+
+        return super(CultioLitModel, self).transfer_batch_to_device(batch, device, dataloader_idx)
+
     @staticmethod
     def get_cuda_memory():
         t = torch.cuda.get_device_properties(0).total_memory
@@ -1,13 +1,226 @@
 import typing as T
+import math
 
 import torch
 import torch.nn.functional as F
 from torch_geometric import nn
 from torch_geometric.data import Data
+from torch_geometric.utils import softmax
+
+try:
+    from torch_sparse import SparseTensor
+except ImportError:
+    SparseTensor = None
+
+
+def to_adj_t(
+    edge_index: torch.Tensor, edge_weight: torch.Tensor, num_nodes: int
+) -> T.Tuple[T.Union[torch.Tensor, 'SparseTensor'], T.Union[torch.Tensor, None]]:
+    """Converts weighted edges to a transposed sparse adjacency for fused sparse-dense matrix multiplication
+
+    If ``torch_sparse`` is not installed, the edges are returned unchanged.
+
+    Returns:
+        The adjacency (or edge indices) and the edge weights (``None`` for a sparse adjacency).
+    """
+    if SparseTensor is None:
+        return edge_index, edge_weight
+
+    adj_t = SparseTensor(
+        row=edge_index[0],
+        col=edge_index[1],
+        value=edge_weight,
+        sparse_sizes=(num_nodes, num_nodes)
+    ).t()
+
+    return adj_t, None
+
+
+def get_batch_shape(data: Data) -> T.Tuple[int, int, int]:
+    """Gets the number of graphs and the grid rows and columns of a batch as Python ints
+
+    The host-side ``batch_shape`` set before the batch is moved to the device is used if available,
+    which avoids device syncs.
+    """
+    batch_shape = getattr(data, 'batch_shape', None)
+    if batch_shape is not None:
+        if not all(isinstance(n, int) for n in batch_shape):
+            raise TypeError('The batch_shape must be given as Python ints.')
+        nbatch, nrows, ncols = batch_shape
+    else:
+        nbatch, nrows, ncols = get_batch_count(data.batch), int(data.height[0]), int(data.width[0])
+
+    return nbatch, nrows, ncols
 
 
 def get_batch_count(batch: torch.Tensor) -> int:
-    return batch.unique().size(0)
+    """Gets the number of graphs in a batch
+
+    PyG batch vectors are sorted, so the last index is the batch size - 1.
+    """
+    return int(batch[-1]) + 1
+
+
+def bands_to_graphs(x: torch.Tensor, num_bands: int) -> torch.Tensor:
+    """Stacks the band time series of each node as separate graphs
+
+    (N x bands x time) or (N x bands*time) -> (bands*N x time)
+    """
+    num_nodes = x.shape[0]
+
+    return x.reshape(num_nodes, num_bands, -1).transpose(0, 1).reshape(num_bands*num_nodes, -1)
+
+
+def graphs_to_bands(x: torch.Tensor, num_bands: int) -> torch.Tensor:
+    """Concatenates band graphs stacked by ``bands_to_graphs`` along the features
+
+    (bands*N x features) -> (N x bands*features)
+    """
+    num_nodes = x.shape[0] // num_bands
+
+    return x.reshape(num_bands, num_nodes, -1).transpose(0, 1).reshape(num_nodes, -1)
+
+
+def repeat_edges(
+    edge_index: torch.Tensor, edge_attrs: torch.Tensor, num_nodes: int, num_repeats: int
+) -> T.Tuple[torch.Tensor, torch.Tensor]:
+    """Repeats edges for graphs stacked by ``bands_to_graphs``, offsetting the node indices of each copy
+    """
+    num_edges = edge_index.shape[1]
+    offsets = torch.arange(
+        num_repeats, device=edge_index.device
+    ).repeat_interleave(num_edges) * num_nodes
+    edge_index = edge_index.repeat(1, num_repeats) + offsets
+    edge_attrs = torch.cat([edge_attrs] * num_repeats, dim=0)
+
+    return edge_index, edge_attrs
+
+
+class LayerNormELULinear(torch.nn.Module):
+    """Layer normalization over the node channels, followed by an in-place ELU activation and a linear layer
+    """
+    def __init__(self, in_channels: int, out_channels: int, alpha: float = 0.1):
+        super(LayerNormELULinear, self).__init__()
+
+        self.alpha = alpha
+        self.norm = torch.nn.LayerNorm(in_channels)
+        self.lin = torch.nn.Linear(in_channels, out_channels)
+
+    def __call__(self, *args, **kwargs):
+        return self.forward(*args, **kwargs)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        # The normalized tensor is not needed by the backward pass, so the activation can be in-place
+        return self.lin(F.elu(self.norm(x), alpha=self.alpha, inplace=True))
+
+
+class FeatureStack(object):
+    """Stacks node features along the channel dimension
+
+    Without gradients, features are written into a single preallocated buffer. With gradients,
+    they are concatenated, since writing into the buffer would modify tensors saved for the
+    backward pass.
+
+    Args:
+        features (list): The initial features, each shaped (N x C).
+        num_channels (int): The total number of channels after all features are appended.
+    """
+    def __init__(self, features: T.Sequence[torch.Tensor], num_channels: int):
+        self.use_buffer = not torch.is_grad_enabled()
+        if self.use_buffer:
+            self.buffer = features[0].new_empty((features[0].shape[0], num_channels))
+            self.size = 0
+            for x in features:
+                self.append(x)
+        else:
+            self.buffer = torch.cat(features, dim=1)
+
+    @property
+    def h(self) -> torch.Tensor:
+        if self.use_buffer:
+            return self.buffer[:, :self.size]
+
+        return self.buffer
+
+    def append(self, x: torch.Tensor) -> None:
+        if self.use_buffer:
+            self.buffer[:, self.size:self.size+x.shape[1]] = x
+            self.size += x.shape[1]
+        else:
+            self.buffer = torch.cat([self.buffer, x], dim=1)
+
+
+class BandTransformerConv(torch.nn.Module):
+    """A single-head graph transformer over each band time series, with weights shared across bands
+
+    This is equivalent to applying ``TransformerConv(in_channels, out_channels, heads=1, edge_dim=edge_dim)``
+    to each band, but the edges and their embeddings are broadcast over the bands rather than repeated.
+
+    Args:
+        in_channels (int): The number of time features in each band.
+        out_channels (int): The number of output features for each band.
+        num_bands (int): The number of bands.
+        edge_dim (int): The number of edge features.
+        dropout (float): The dropout fraction of the attention coefficients.
+    """
+    def __init__(
+        self,
+        in_channels: int,
+        out_channels: int,
+        num_bands: int,
+        edge_dim: int = 2,
+        dropout: float = 0.0
+    ):
+        super(BandTransformerConv, self).__init__()
+
+        self.out_channels = out_channels
+        self.num_bands = num_bands
+        self.dropout = dropout
+
+        # Parameter names follow ``TransformerConv``
+        self.lin_key = nn.Linear(in_channels, out_channels)
+        self.lin_query = nn.Linear(in_channels, out_channels)
+        self.lin_value = nn.Linear(in_channels, out_channels)
+        self.lin_edge = nn.Linear(edge_dim, out_channels, bias=False)
+        self.lin_skip = nn.Linear(in_channels, out_channels)
+
+    def __call__(self, *args, **kwargs):
+        return self.forward(*args, **kwargs)
+
+    def forward(
+        self, x: torch.Tensor, edge_index: torch.Tensor, edge_attrs: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Args:
+            x: The node features, shaped (N x bands x time) or (N x bands*time).
+            edge_index: The edge indices, shaped (2 x E).
+            edge_attrs: The edge features, shaped (E x edge_dim).
+
+        Returns:
+            The node features, shaped (N x bands*out_channels).
+        """
+        num_nodes = x.shape[0]
+        # (N x bands x time)
+        x = x.reshape(num_nodes, self.num_bands, -1)
+        src, dst = edge_index
+
+        query = self.lin_query(x)
+        key = self.lin_key(x)
+        value = self.lin_value(x)
+        # (E x 1 x out_channels), broadcast over the bands
+        edge_emb = self.lin_edge(edge_attrs).unsqueeze(1)
+
+        key_j = key[src] + edge_emb
+        # (E x bands)
+        alpha = (query[dst] * key_j).sum(dim=-1) / math.sqrt(self.out_channels)
+        alpha = softmax(alpha, dst, num_nodes=num_nodes)
+        alpha = F.dropout(alpha, p=self.dropout, training=self.training)
+
+        messages = (value[src] + edge_emb) * alpha.unsqueeze(-1)
+        out = messages.new_zeros((num_nodes, self.num_bands, self.out_channels)).index_add_(0, dst, messages)
+        out = out + self.lin_skip(x)
+
+        return out.reshape(num_nodes, -1)
 
 
 class UpSample(torch.nn.Module):
@@ -23,6 +236,24 @@ class UpSample(torch.nn.Module):
         return F.interpolate(x, size=size, mode='bilinear', align_corners=True)
 
 
+def graph_to_conv(x: torch.Tensor, nbatch: int, nrows: int, ncols: int) -> torch.Tensor:
+    n_channels = x.shape[1]
+
+    return x.reshape(nbatch, nrows, ncols, n_channels).permute(0, 3, 1, 2)
+
+
+def graph_to_time_conv(x: torch.Tensor, nbatch: int, nrows: int, ncols: int) -> torch.Tensor:
+    nbands, ntime = x.shape[1], x.shape[2]
+
+    return x.view(nbatch, nrows, ncols, nbands, ntime).permute(0, 4, 3, 1, 2)
+
+
+def conv_to_graph(x: torch.Tensor) -> torch.Tensor:
+    nbatch, n_channels, nrows, ncols = x.shape
+
+    return x.permute(0, 2, 3, 1).reshape(nbatch*nrows*ncols, n_channels)
+
+
 class GraphToConv(torch.nn.Module):
     """Reshapes a 2d tensor to a 4d tensor
     """
@@ -33,9 +264,22 @@ class GraphToConv(torch.nn.Module):
         return self.forward(*args, **kwargs)
 
     def forward(self, x: torch.Tensor, nbatch: int, nrows: int, ncols: int) -> torch.Tensor:
-        n_channels = x.shape[1]
+        return graph_to_conv(x, nbatch, nrows, ncols)
 
-        return x.reshape(nbatch, nrows, ncols, n_channels).permute(0, 3, 1, 2)
+
+class GraphToTimeConv(torch.nn.Module):
+    """Reshapes a 3d tensor of band time series to a 5d time series tensor
+
+    (N x bands x time) -> (B x time x bands x H x W), as a view without copying
+    """
+    def __init__(self):
+        super(GraphToTimeConv, self).__init__()
+
+    def __call__(self, *args, **kwargs):
+        return self.forward(*args, **kwargs)
+
+    def forward(self, x: torch.Tensor, nbatch: int, nrows: int, ncols: int) -> torch.Tensor:
+        return graph_to_time_conv(x, nbatch, nrows, ncols)
 
 
 class ConvToGraph(torch.nn.Module):
@@ -48,9 +292,7 @@ class ConvToGraph(torch.nn.Module):
         return self.forward(*args, **kwargs)
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        nbatch, n_channels, nrows, ncols = x.shape
-
-        return x.permute(0, 2, 3, 1).reshape(nbatch*nrows*ncols, n_channels)
+        return conv_to_graph(x)
 
 
 def max_pool_neighbor_x(x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
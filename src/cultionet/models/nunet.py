@@ -17,8 +17,9 @@ class VGGBlock(torch.nn.Module):
     def __init__(self, in_channels: int, mid_channels: int, out_channels: int):
         super(VGGBlock, self).__init__()
 
-        conv1 = nn.GCNConv(in_channels, mid_channels, improved=True)
-        conv2 = nn.GCNConv(mid_channels, out_channels, improved=True)
+        # The edges are normalized by the caller
+        conv1 = nn.GCNConv(in_channels, mid_channels, normalize=False)
+        conv2 = nn.GCNConv(mid_channels, out_channels, normalize=False)
 
         self.seq = nn.Sequential('x, edge_index, edge_weight',
                                  [
@@ -150,7 +151,7 @@ class NestedUNet(torch.nn.Module):
         self.conv0_4 = DoubleConv(nb_filter[0]*4+nb_filter[1], nb_filter[0], nb_filter[0])
 
         self.final2d = torch.nn.Conv2d(nb_filter[0], out_channels, kernel_size=1)
-        self.final = nn.GCNConv(out_channels, out_channels, improved=True)
+        self.final = nn.GCNConv(out_channels, out_channels, normalize=False)
 
     def __call__(self, *args, **kwargs):
         return self.forward(*args, **kwargs)
@@ -160,11 +161,19 @@ class NestedUNet(torch.nn.Module):
         x: torch.Tensor,
         edge_index: torch.Tensor,
         edge_weight: torch.Tensor,
-        batch: torch.Tensor,
+        nbatch: int,
         nrows: int,
         ncols: int
     ) -> torch.Tensor:
-        nbatch = batch.unique().size(0)
+        """
+        Args:
+            x: The node features.
+            edge_index: The edge indices, normalized with ``gcn_norm(..., improved=True, add_self_loops=True)``.
+            edge_weight: The normalized edge weights.
+            nbatch: The number of graphs.
+            nrows: The number of grid rows.
+            ncols: The number of grid columns.
+        """
 
         x0_0 = self.conv0_0(x, edge_index, edge_weight)
         # Reshape to CNN 4d
@@ -404,7 +404,8 @@ def main():
         if process == 'create':
             subparser.add_argument(
                 '-n', '--num-workers', dest='num_workers',
-                help='The number of CPUs for data creation (default: %(default)s)',
+                help='The number of processes for data creation. Grids are created in parallel, each '
+                     'in its own process, if > 1 (default: %(default)s)',
                 default=4, type=int
             )
             subparser.add_argument(
@@ -0,0 +1,326 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+from cultionet.data.create import (
+    _init_grid_worker,
+    check_slivers,
+    close_edge_ends,
+    create_boundary_distances,
+    create_dataset,
+    fill_field_gaps,
+    focal_compare,
+    label_segments,
+    make_crops_uniform,
+    normalize_boundary_distances,
+    segment_props,
+    thin_edges
+)
+
+import geopandas as gpd
+import numba
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+import torch
+
+
+def test_focal_compare():
+    arr = np.array(
+        [
+            [1, 1, 0],
+            [1, 2, 0],
+            [0, 0, 3]
+        ],
+        dtype='uint8'
+    )
+    # Matching cells in each (edge-padded) 3x3 window, including the center
+    expected = np.array(
+        [
+            [8, 5, 0],
+            [5, 1, 0],
+            [0, 0, 4]
+        ],
+        dtype='uint8'
+    )
+
+    assert np.array_equal(focal_compare(arr), expected)
+
+
+def test_focal_compare_squeeze():
+    arr = np.ones((1, 4, 5), dtype='uint8')
+
+    assert np.array_equal(focal_compare(arr), np.full((4, 5), 9, dtype='uint8'))
+
+
+def test_close_edge_ends():
+    labels_array = np.array(
+        [
+            [0, 0, 0, 0],
+            [0, 1, 2, 0],
+            [0, 1, 1, 0],
+            [0, 0, 0, 0]
+        ],
+        dtype='uint8'
+    )
+    # Each border takes the crop pixels of its interior neighbor (row/column 1 and -2)
+    expected = np.array(
+        [
+            [1, 1, 0, 0],
+            [1, 1, 2, 0],
+            [1, 1, 1, 1],
+            [1, 1, 1, 1]
+        ],
+        dtype='uint8'
+    )
+
+    assert np.array_equal(close_edge_ends(labels_array), expected)
+
+
+# Two 8-pixel segments, separated by a column of edges
+CROP_EDGES = np.array(
+    [
+        [0, 0, 1, 0, 0],
+        [0, 0, 1, 0, 0],
+        [0, 0, 1, 0, 0],
+        [0, 0, 1, 0, 0]
+    ],
+    dtype='uint8'
+)
+# The left segment is majority crop (5 of 8 pixels), with more non-crop pixels than
+# any one crop class. The right segment is minority crop (3 of 8 pixels).
+CROP_LABELS = np.array(
+    [
+        [3, 3, 0, 7, 0],
+        [4, 5, 0, 7, 0],
+        [6, 0, 0, 7, 0],
+        [0, 0, 0, 0, 0]
+    ],
+    dtype='uint8'
+)
+
+
+def test_make_crops_uniform_boundaries():
+    labels_array, segments = make_crops_uniform(
+        CROP_LABELS.copy(), CROP_EDGES, data_type='boundaries'
+    )
+    expected = np.zeros(CROP_LABELS.shape, dtype='uint8')
+    expected[:, :2] = 1
+
+    assert np.array_equal(labels_array, expected)
+    assert segments.shape == CROP_LABELS.shape
+
+
+def test_make_crops_uniform_classes():
+    labels_array, __ = make_crops_uniform(
+        CROP_LABELS.copy(), CROP_EDGES, data_type='crop_type'
+    )
+    # Non-crop pixels are ignored when taking the majority class
+    expected = np.zeros(CROP_LABELS.shape, dtype='uint8')
+    expected[:, :2] = 3
+
+    assert np.array_equal(labels_array, expected)
+
+
+# A crop pixel above an edge pixel
+GAP_LABELS = np.array(
+    [
+        [0, 1, 0],
+        [0, 2, 0],
+        [0, 0, 0]
+    ],
+    dtype='uint8'
+)
+
+
+def test_fill_field_gaps():
+    # Gaps next to crop are filled; edges do not count as crop neighbors and are set to 0
+    expected = np.array(
+        [
+            [1, 1, 1],
+            [0, 0, 0],
+            [0, 0, 0]
+        ],
+        dtype='uint8'
+    )
+    filled = fill_field_gaps(GAP_LABELS)
+
+    assert filled.dtype == np.uint8
+    assert np.array_equal(filled, expected)
+
+
+def test_fill_field_gaps_reset_edges():
+    expected = np.array(
+        [
+            [1, 1, 1],
+            [0, 2, 0],
+            [0, 0, 0]
+        ],
+        dtype='uint8'
+    )
+
+    assert np.array_equal(fill_field_gaps(GAP_LABELS, reset_edges=True), expected)
+
+
+def create_grid_inputs(path: Path):
+    """Creates a 1-band, 3-date time series with two 20x20 grids, each with one field
+    """
+    left, top, res = 500000.0, 4000000.0, 10.0
+    (path / 'evi').mkdir(parents=True)
+    rng = np.random.default_rng(0)
+    image_list = []
+    for t in range(3):
+        image_path = path / 'evi' / f'2020{t+1:02d}01.tif'
+        with rasterio.open(
+            image_path, 'w', driver='GTiff', height=20, width=40, count=1, dtype='uint16',
+            crs='EPSG:32615', transform=from_origin(left, top, res, res)
+        ) as dst:
+            dst.write(rng.integers(0, 10000, (1, 20, 40), dtype='uint16'))
+        image_list.append(str(image_path))
+
+    df_grids = gpd.GeoDataFrame(
+        {'grid': [0, 1]},
+        geometry=[box(left, top-200, left+200, top), box(left+200, top-200, left+400, top)],
+        crs='EPSG:32615'
+    )
+    df_edges = gpd.GeoDataFrame(
+        {'class': [1, 1]},
+        geometry=[box(left+20, top-180, left+180, top-20), box(left+220, top-180, left+380, top-20)],
+        crs='EPSG:32615'
+    )
+
+    return image_list, df_grids, df_edges
+
+
+def test_init_grid_worker():
+    num_threads = numba.get_num_threads()
+    try:
+        _init_grid_worker()
+        assert numba.get_num_threads() == 1
+    finally:
+        numba.set_num_threads(num_threads)
+
+
+def test_create_dataset_workers(tmp_path):
+    image_list, df_grids, df_edges = create_grid_inputs(tmp_path)
+    process_paths = {}
+    for num_workers in (1, 2):
+        process_paths[num_workers] = tmp_path / f'workers_{num_workers}'
+        process_paths[num_workers].mkdir()
+        create_dataset(
+            image_list,
+            df_grids,
+            df_edges,
+            group_id='test_2020',
+            process_path=process_paths[num_workers],
+            transforms=['none'],
+            num_workers=num_workers
+        )
+
+    file_names = sorted(fn.name for fn in process_paths[1].glob('data_*.pt'))
+    assert file_names == ['data_test_2020_0_none.pt', 'data_test_2020_1_none.pt']
+    # Grids created in the process pool match grids created sequentially
+    assert sorted(fn.name for fn in process_paths[2].glob('data_*.pt')) == file_names
+    for file_name in file_names:
+        data = torch.load(process_paths[1] / file_name, weights_only=False)
+        pool_data = torch.load(process_paths[2] / file_name, weights_only=False)
+        assert torch.equal(data.x, pool_data.x)
+        assert torch.equal(data.y, pool_data.y)
+
+
+def test_thin_edges():
+    # A 2-pixel wide edge crossing the image
+    edges = np.zeros((6, 8), dtype='uint8')
+    edges[:, 3:5] = 1
+    expected = np.zeros((6, 8), dtype='uint8')
+    expected[:, 4] = 1
+
+    # Thinned to a single-pixel line that still reaches the image borders
+    assert np.array_equal(thin_edges(edges), expected)
+
+
+def test_thin_edges_corner():
+    # A 2-pixel wide edge that turns from the top border to the right border
+    edges = np.zeros((8, 8), dtype='uint8')
+    edges[:5, 3:5] = 1
+    edges[3:5, 3:] = 1
+    expected = np.zeros((8, 8), dtype='uint8')
+    expected[:3, 4] = 1
+    expected[3, 5:] = 1
+
+    assert np.array_equal(thin_edges(edges), expected)
+
+
+# A 3x3 field, a 1-pixel tall field, a 2x4 field and a single-pixel field
+SEGMENT_MASK = np.array(
+    [
+        [1, 1, 1, 0, 0, 0, 0, 0],
+        [1, 1, 1, 0, 1, 1, 1, 1],
+        [1, 1, 1, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 1, 1, 1, 1, 0, 0, 1],
+        [0, 1, 1, 1, 1, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0]
+    ],
+    dtype='uint8'
+)
+# Stands in for the image array, which only provides the cell size
+SRC_TS = SimpleNamespace(gw=SimpleNamespace(celly=10.0))
+
+
+def test_segment_props():
+    segments, num_segments = label_segments(SEGMENT_MASK)
+    props = segment_props(segments)
+
+    assert num_segments == 4
+    # Labels in raster order, bounding boxes as (min_row, min_col, max_row, max_col)
+    assert [(p.label, p.bbox, p.area) for p in props] == [
+        (1, (0, 0, 3, 3), 9),
+        (2, (1, 4, 2, 8), 4),
+        (3, (4, 1, 6, 5), 8),
+        (4, (4, 7, 5, 8), 1)
+    ]
+
+
+def test_check_slivers():
+    segments, __ = label_segments(SEGMENT_MASK)
+    edges = np.zeros(SEGMENT_MASK.shape, dtype='uint8')
+    edges[3] = 1
+    labels_array, props = check_slivers(SEGMENT_MASK.copy(), edges, segments)
+    # The 1-pixel tall and single-pixel fields are removed
+    expected = SEGMENT_MASK.copy()
+    expected[1, 4:] = 0
+    expected[4, 7] = 0
+    expected[3] = 2
+
+    assert np.array_equal(labels_array, expected)
+    assert len(props) == 4
+
+
+def test_normalize_boundary_distances():
+    bdist = normalize_boundary_distances(SEGMENT_MASK.copy(), 'polygon', SRC_TS)
+    # Each field is scaled by its maximum distance, and thin fields are set to 0.1
+    expected = np.array(
+        [
+            [1, 2/3, 1/3, 0, 0, 0, 0, 0],
+            [2/3, 2/3, 1/3, 0, 0.1, 0.1, 0.1, 0.1],
+            [1/3, 1/3, 1/3, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 1, 1, 1, 1, 0, 0, 0.1],
+            [0, 1, 1, 1, 1, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0]
+        ]
+    )
+
+    assert np.allclose(bdist, expected, atol=1e-4)
+
+
+def test_normalize_boundary_distances_no_segments():
+    labels_array = np.zeros((5, 5), dtype='uint8')
+    mask, segments, bdist = create_boundary_distances(labels_array, 'polygon', SRC_TS)
+
+    assert not segments.any()
+    assert not bdist.any()
+    assert np.array_equal(
+        normalize_boundary_distances(labels_array, 'polygon', SRC_TS), np.zeros((5, 5))
+    )
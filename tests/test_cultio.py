@@ -0,0 +1,109 @@
+import io
+
+from cultionet.models.cultio import CultioGraphNet
+
+import torch
+from torch_geometric.data import Batch, Data
+import pytest
+
+
+NUM_BANDS = 3
+NUM_TIME = 4
+
+
+def create_batch(nbatch: int = 2, nrows: int = 16, ncols: int = 20, seed: int = 0) -> Batch:
+    """Creates a batch of synthetic grid graphs
+    """
+    torch.manual_seed(seed)
+    idx = torch.arange(nrows*ncols).view(nrows, ncols)
+    src = torch.cat([idx[:, :-1].flatten(), idx[:, 1:].flatten(), idx[:-1].flatten(), idx[1:].flatten()])
+    dst = torch.cat([idx[:, 1:].flatten(), idx[:, :-1].flatten(), idx[1:].flatten(), idx[:-1].flatten()])
+    edge_index = torch.stack([src, dst])
+    data_list = [
+        Data(
+            x=torch.rand(nrows*ncols, NUM_BANDS*NUM_TIME),
+            edge_index=edge_index,
+            edge_attrs=torch.rand(edge_index.shape[1], 2),
+            height=torch.tensor([nrows]),
+            width=torch.tensor([ncols])
+        )
+        for __ in range(nbatch)
+    ]
+
+    return Batch.from_data_list(data_list)
+
+
+def test_forward_backward():
+    batch = create_batch()
+    model = CultioGraphNet(NUM_BANDS*NUM_TIME, NUM_TIME, filters=8)
+    model.train()
+    distances, edges, labels = model(batch)
+
+    assert distances.shape == (batch.num_nodes, 3)
+    assert edges.shape == (batch.num_nodes, 2)
+    assert labels.shape == (batch.num_nodes, 2)
+
+    (distances.sum() + edges.sum() + labels.sum()).backward()
+
+    assert all(
+        torch.isfinite(p.grad).all() for p in model.parameters() if p.grad is not None
+    )
+
+
+def test_save_compiled():
+    model = CultioGraphNet(NUM_BANDS*NUM_TIME, NUM_TIME, filters=8, compile_model=True)
+    buffer = io.BytesIO()
+    torch.save(model, buffer)
+    buffer.seek(0)
+    loaded_model = torch.load(buffer, weights_only=False)
+
+    # The compiled forward pass is rebuilt on load
+    assert '_forward_core' in loaded_model.__dict__
+    assert loaded_model._forward_core is not model._forward_core
+    for key, value in model.state_dict().items():
+        assert torch.equal(loaded_model.state_dict()[key], value)
+
+
+def test_save_compiled_shapes():
+    model = CultioGraphNet(NUM_BANDS*NUM_TIME, NUM_TIME, filters=8, compile_shapes=[(16, 20)])
+    buffer = io.BytesIO()
+    torch.save(model, buffer)
+    buffer.seek(0)
+    loaded_model = torch.load(buffer, weights_only=False)
+
+    assert list(loaded_model._compiled_nunet) == [(16, 20)]
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason='CUDA graphs require a GPU')
+def test_cuda_graph_replay():
+    model = CultioGraphNet(NUM_BANDS*NUM_TIME, NUM_TIME, filters=8, cuda_graph=True).cuda()
+    model.eval()
+
+    def eager_forward(batch: Batch):
+        model.cuda_graph = False
+        outputs = model(batch)
+        model.cuda_graph = True
+
+        return outputs
+
+    batch = create_batch().cuda()
+    # A new grid size invalidates the captured graph
+    other_batch = create_batch(nbatch=3, nrows=20, ncols=16).cuda()
+    with torch.no_grad():
+        for current_batch in (batch, batch, other_batch, batch):
+            expected = eager_forward(current_batch)
+            outputs = model(current_batch)
+            assert len(model._cuda_graphs) == 1
+            for output, expected_output in zip(outputs, expected):
+                assert torch.allclose(output, expected_output, atol=1e-5)
+
+        # Returned outputs are not overwritten by later replays
+        first_outputs = model(batch)
+        first_copy = [output.clone() for output in first_outputs]
+        model(create_batch(seed=1).cuda())
+        for output, output_copy in zip(first_outputs, first_copy):
+            assert torch.equal(output, output_copy)
+
+    # Changing the parameters releases the graph
+    model.double()
+    assert len(model._cuda_graphs) == 0
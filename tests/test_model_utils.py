@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+from cultionet.models.model_utils import BandTransformerConv, get_batch_shape
+
+import torch
+from torch_geometric import nn
+import pytest
+
+
+def test_band_transformer_conv():
+    num_nodes, num_bands, num_time, out_channels = 30, 3, 4, 5
+    torch.manual_seed(0)
+    x = torch.rand(num_nodes, num_bands, num_time)
+    edge_index = torch.randint(0, num_nodes, (2, 100))
+    edge_attrs = torch.rand(100, 2)
+
+    conv = nn.TransformerConv(num_time, out_channels, heads=1, edge_dim=2)
+    band_conv = BandTransformerConv(num_time, out_channels, num_bands, edge_dim=2)
+    band_conv.load_state_dict(conv.state_dict())
+    conv.eval()
+    band_conv.eval()
+
+    # A shared-weight transformer convolution applied to each band
+    expected = torch.cat(
+        [conv(x[:, band], edge_index, edge_attrs) for band in range(num_bands)], dim=1
+    )
+    out = band_conv(x, edge_index, edge_attrs)
+
+    assert out.shape == (num_nodes, num_bands*out_channels)
+    assert torch.allclose(out, expected, atol=1e-6)
+    # Flattened (N x bands*time) inputs give the same result
+    assert torch.allclose(band_conv(x.reshape(num_nodes, -1), edge_index, edge_attrs), out)
+
+
+def test_get_batch_shape():
+    batch = torch.arange(2).repeat_interleave(12)
+    data = SimpleNamespace(batch=batch, height=torch.tensor([3, 3]), width=torch.tensor([4, 4]))
+
+    # Read from the tensors when no host-side shape is stored
+    assert get_batch_shape(data) == (2, 3, 4)
+
+    data.batch_shape = (2, 3, 4)
+    assert get_batch_shape(data) == (2, 3, 4)
+
+    data.batch_shape = (2, torch.tensor(3), 4)
+    with pytest.raises(TypeError):
+        get_batch_shape(data)